@@ -3,4 +3,4 @@ mod traits;
 
 pub mod models;
 pub use principal::PrincipalAPI;
-pub use traits::{API, APIMeta};
+pub use traits::{API, APIMeta, pack_batches, unpack_batch_replies};
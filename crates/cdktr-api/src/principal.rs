@@ -1,3 +1,5 @@
+use std::fmt::Write;
+
 use super::traits::{API, APIMeta};
 use zeromq::ZmqMessage;
 
@@ -66,6 +68,8 @@ pub enum PrincipalAPI {
     GetRegisteredAgents,
 }
 
+use helpers::{non_empty, required_arg, timestamp_or_none};
+
 impl TryFrom<ZMQArgs> for PrincipalAPI {
     type Error = GenericError;
     fn try_from(mut args: ZMQArgs) -> Result<Self, Self::Error> {
@@ -78,131 +82,54 @@ impl TryFrom<ZMQArgs> for PrincipalAPI {
             "PING" => Ok(Self::Ping),
             "LSWORKFLOWS" => Ok(Self::ListWorkflowStore),
             "RUNTASK" => Ok(Self::RunTask(helpers::create_run_task_payload(args)?)),
-            "REGISTERAGENT" => match args.next() {
-                Some(agent_id) => Ok(Self::RegisterAgent(agent_id)),
-                None => Err(GenericError::ParseError("Missing arg AGENT_ID".to_string())),
-            },
-            "AGENTWORKFLOWSTATUS" => match args.next() {
-                Some(agent_id) => match args.next() {
-                    Some(task_id) => match args.next() {
-                        Some(task_exe_id) => match args.next() {
-                            Some(status) => {
-                                let status = RunStatus::try_from(status)?;
-                                Ok(Self::WorkflowStatusUpdate(
-                                    agent_id,
-                                    task_id,
-                                    task_exe_id,
-                                    status,
-                                ))
-                            }
-                            None => Err(GenericError::ParseError(
-                                "Missing arg TASK_STATUS".to_string(),
-                            )),
-                        },
-                        None => Err(GenericError::ParseError(
-                            "Missing arg TASK_EXECUTION_ID".to_string(),
-                        )),
-                    },
-                    None => Err(GenericError::ParseError("Missing arg TASK_ID".to_string())),
-                },
-                None => Err(GenericError::ParseError("Missing arg AGENT_ID".to_string())),
-            },
-            "AGENTTASKSTATUS" => match args.next() {
-                Some(agent_id) => match args.next() {
-                    Some(task_id) => match args.next() {
-                        Some(task_exe_id) => match args.next() {
-                            Some(workflow_instance_id) => match args.next() {
-                                Some(status) => {
-                                    let status = RunStatus::try_from(status)?;
-                                    Ok(Self::TaskStatusUpdate(
-                                        agent_id,
-                                        task_id,
-                                        task_exe_id,
-                                        workflow_instance_id,
-                                        status,
-                                    ))
-                                }
-                                None => Err(GenericError::ParseError(
-                                    "Missing arg TASK_STATUS".to_string(),
-                                )),
-                            },
-                            None => Err(GenericError::ParseError(
-                                "Missing arg WORKFLOW_INSTANCE_ID".to_string(),
-                            )),
-                        },
-                        None => Err(GenericError::ParseError(
-                            "Missing arg TASK_EXECUTION_ID".to_string(),
-                        )),
-                    },
-                    None => Err(GenericError::ParseError("Missing arg TASK_ID".to_string())),
-                },
-                None => Err(GenericError::ParseError("Missing arg AGENT_ID".to_string())),
-            },
-            "FETCHWORKFLOW" => match args.next() {
-                Some(agent_id) => Ok(Self::FetchWorkflow(agent_id)),
-                None => Err(GenericError::ParseError("Missing agent id".to_string())),
-            },
-            "QUERYLOGS" => match args.next() {
-                Some(end_ts) => {
-                    let end_ts_opt = if end_ts.len() > 0 {
-                        Some(end_ts.parse().map_err(|_e| {
-                            GenericError::ParseError("Not a valid end timestamp".to_string())
-                        })?)
-                    } else {
-                        None
-                    };
-                    match args.next() {
-                        Some(start_ts) => {
-                            let start_ts_opt = if start_ts.len() > 0 {
-                                Some(start_ts.parse().map_err(|_e| {
-                                    GenericError::ParseError(
-                                        "Not a valid end timestamp".to_string(),
-                                    )
-                                })?)
-                            } else {
-                                None
-                            };
-                            match args.next() {
-                                Some(wf_id) => {
-                                    let wf_id_opt =
-                                        if wf_id.len() > 0 { Some(wf_id) } else { None };
-                                    match args.next() {
-                                        Some(wf_ins_id) => {
-                                            let wf_ins_id_opt = if wf_ins_id.len() > 0 {
-                                                Some(wf_ins_id)
-                                            } else {
-                                                None
-                                            };
-                                            Ok(Self::QueryLogs(
-                                                end_ts_opt,
-                                                start_ts_opt,
-                                                wf_id_opt,
-                                                wf_ins_id_opt,
-                                                match args.next() {
-                                                    Some(v) => v.len() > 0,
-                                                    None => false,
-                                                },
-                                            ))
-                                        }
-                                        None => Err(GenericError::ParseError(
-                                            "Missing WORKFLOW_INSTANCE_ID parameter".to_string(),
-                                        )),
-                                    }
-                                }
-                                None => Err(GenericError::ParseError(
-                                    "Missing WORKFLOW_ID parameter".to_string(),
-                                )),
-                            }
-                        }
-                        None => Err(GenericError::ParseError(
-                            "Missing START_TIMESTAMP parameter".to_string(),
-                        )),
-                    }
-                }
-                None => Err(GenericError::ParseError(
-                    "Missing END_TIMESTAMP".to_string(),
-                )),
-            },
+            "REGISTERAGENT" => Ok(Self::RegisterAgent(required_arg(
+                &mut args,
+                "Missing arg AGENT_ID",
+            )?)),
+            "AGENTWORKFLOWSTATUS" => {
+                let agent_id = required_arg(&mut args, "Missing arg AGENT_ID")?;
+                let task_id = required_arg(&mut args, "Missing arg TASK_ID")?;
+                let task_exe_id = required_arg(&mut args, "Missing arg TASK_EXECUTION_ID")?;
+                let status = required_arg(&mut args, "Missing arg TASK_STATUS")?;
+                Ok(Self::WorkflowStatusUpdate(
+                    agent_id,
+                    task_id,
+                    task_exe_id,
+                    RunStatus::try_from(status)?,
+                ))
+            }
+            "AGENTTASKSTATUS" => {
+                let agent_id = required_arg(&mut args, "Missing arg AGENT_ID")?;
+                let task_id = required_arg(&mut args, "Missing arg TASK_ID")?;
+                let task_exe_id = required_arg(&mut args, "Missing arg TASK_EXECUTION_ID")?;
+                let workflow_instance_id =
+                    required_arg(&mut args, "Missing arg WORKFLOW_INSTANCE_ID")?;
+                let status = required_arg(&mut args, "Missing arg TASK_STATUS")?;
+                Ok(Self::TaskStatusUpdate(
+                    agent_id,
+                    task_id,
+                    task_exe_id,
+                    workflow_instance_id,
+                    RunStatus::try_from(status)?,
+                ))
+            }
+            "FETCHWORKFLOW" => Ok(Self::FetchWorkflow(required_arg(
+                &mut args,
+                "Missing agent id",
+            )?)),
+            "QUERYLOGS" => {
+                let end_ts = required_arg(&mut args, "Missing END_TIMESTAMP")?;
+                let start_ts = required_arg(&mut args, "Missing START_TIMESTAMP parameter")?;
+                let wf_id = required_arg(&mut args, "Missing WORKFLOW_ID parameter")?;
+                let wf_ins_id = required_arg(&mut args, "Missing WORKFLOW_INSTANCE_ID parameter")?;
+                Ok(Self::QueryLogs(
+                    timestamp_or_none(end_ts)?,
+                    timestamp_or_none(start_ts)?,
+                    non_empty(wf_id),
+                    non_empty(wf_ins_id),
+                    args.next().is_some_and(|v| v.len() > 0),
+                ))
+            }
             "GETRECENTSTATUSES" => Ok(Self::GetRecentWorkflowStatuses),
             "GETREGISTEREDAGENTS" => Ok(Self::GetRegisteredAgents),
             _ => Err(GenericError::ParseError(format!(
@@ -284,22 +211,27 @@ impl API for PrincipalAPI {
                 format!("FETCHWORKFLOW\x01{agent_id}")
             }
             Self::QueryLogs(end_ts, start_ts, wf_id, wf_ins_id, verbose) => {
-                format!(
-                    "QUERYLOGS\x01{}\x01{}\x01{}\x01{}\x01{}",
-                    if let Some(ts) = end_ts {
-                        ts.to_string()
-                    } else {
-                        "".to_string()
-                    },
-                    if let Some(ts) = start_ts {
-                        ts.to_string()
-                    } else {
-                        "".to_string()
-                    },
-                    wf_id.clone().unwrap_or("".to_string()),
-                    wf_ins_id.clone().unwrap_or("".to_string()),
-                    if *verbose { "v" } else { "" }
-                )
+                // written straight into the message rather than allocating a
+                // temporary string for each of the optional args
+                let mut msg = String::with_capacity(64);
+                msg.push_str("QUERYLOGS");
+                msg.push('\x01');
+                if let Some(ts) = end_ts {
+                    let _ = write!(msg, "{ts}");
+                }
+                msg.push('\x01');
+                if let Some(ts) = start_ts {
+                    let _ = write!(msg, "{ts}");
+                }
+                msg.push('\x01');
+                msg.push_str(wf_id.as_deref().unwrap_or(""));
+                msg.push('\x01');
+                msg.push_str(wf_ins_id.as_deref().unwrap_or(""));
+                msg.push('\x01');
+                if *verbose {
+                    msg.push('v');
+                }
+                msg
             }
             Self::GetRecentWorkflowStatuses => "GETRECENTSTATUSES".to_string(),
             Self::GetRegisteredAgents => "GETREGISTEREDAGENTS".to_string(),
@@ -348,6 +280,27 @@ mod helpers {
         }
     }
 
+    /// Takes the next arg from the message, returning a parse error with the given
+    /// message if there are no args left
+    pub fn required_arg(args: &mut ZMQArgs, err_msg: &str) -> Result<String, GenericError> {
+        args.next()
+            .ok_or_else(|| GenericError::ParseError(err_msg.to_string()))
+    }
+
+    /// Blank args are used for optional values that haven't been set
+    pub fn non_empty(arg: String) -> Option<String> {
+        if arg.len() > 0 { Some(arg) } else { None }
+    }
+
+    pub fn timestamp_or_none(arg: String) -> Result<Option<u64>, GenericError> {
+        match non_empty(arg) {
+            Some(ts) => Ok(Some(ts.parse().map_err(|_e| {
+                GenericError::ParseError("Not a valid end timestamp".to_string())
+            })?)),
+            None => Ok(None),
+        }
+    }
+
     #[cfg(test)]
     mod tests {}
 }
@@ -365,4 +318,23 @@ mod tests {
                 .expect(&format!("Failed to create AgentAPI from {}", rt));
         }
     }
+
+    #[test]
+    fn test_principal_req_missing_arg() {
+        let err =
+            PrincipalAPI::try_from(ZmqMessage::from("AGENTWORKFLOWSTATUS\x01agent1\x01task1"))
+                .unwrap_err();
+        assert_eq!(
+            err.to_string(),
+            "ParseError: Missing arg TASK_EXECUTION_ID".to_string()
+        );
+    }
+
+    #[test]
+    fn test_query_logs_to_string() {
+        let req = PrincipalAPI::QueryLogs(Some(200), None, Some("wf1".to_string()), None, true);
+        assert_eq!(req.to_string(), "QUERYLOGS\x01200\x01\x01wf1\x01\x01v");
+        let req = PrincipalAPI::QueryLogs(None, Some(100), None, Some("ins".to_string()), false);
+        assert_eq!(req.to_string(), "QUERYLOGS\x01\x01100\x01\x01ins\x01");
+    }
 }
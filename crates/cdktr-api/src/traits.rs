@@ -6,7 +6,7 @@ use cdktr_core::{
     get_cdktr_setting,
     models::ZMQArgs,
     utils::get_default_zmq_timeout,
-    zmq_helpers::send_recv_with_timeout,
+    zmq_helpers::{send_pipelined_with_timeout, send_recv_with_timeout},
 };
 
 use async_trait::async_trait;
@@ -68,6 +68,48 @@ pub trait API: Into<ZmqMessage> + TryFrom<ZmqMessage> + TryFrom<String> + TryFro
         Ok(cli_msg)
     }
 
+    /// Sends a batch of messages to the same destination server. The messages are
+    /// pipelined over a single connection so the next message is sent without waiting
+    /// on the reply to the previous one. A result is returned for each message in the
+    /// same order as the messages were given, which relies on the server answering a
+    /// connection's requests in order. The cdktr servers do this by handing every
+    /// request from one client to the same worker
+    async fn send_pipelined(msgs: Vec<Self>) -> Vec<Result<ClientResponseMessage, GenericError>>
+    where
+        Self: Sized + Send,
+    {
+        Self::send_batched(msgs, 1).await
+    }
+
+    /// Similar to send_pipelined but packs every batch_size messages into the frames
+    /// of a single multipart message. The server handles each frame as a separate request
+    /// and replies to the batch as a whole, which trades a little latency on each message
+    /// for far fewer round trips. A result is returned for each message in the same order
+    /// as the messages were given so a failed batch doesn't lose the responses to the
+    /// batches before it
+    async fn send_batched(
+        msgs: Vec<Self>,
+        batch_size: usize,
+    ) -> Vec<Result<ClientResponseMessage, GenericError>>
+    where
+        Self: Sized + Send,
+    {
+        let endpoint_uri = match msgs.first() {
+            Some(msg) => msg.get_tcp_uri(),
+            None => return Vec::new(),
+        };
+        let total = msgs.len();
+        let batch_size = batch_size.max(1);
+        trace!(
+            "Pipelining {} requests in batches of {} @ {}",
+            total, batch_size, endpoint_uri
+        );
+        let batches = pack_batches(msgs.into_iter().map(Into::into).collect(), batch_size);
+        let timeout = get_default_zmq_timeout();
+        let replies = send_pipelined_with_timeout(endpoint_uri, batches, timeout).await;
+        unpack_batch_replies(replies, total, batch_size)
+    }
+
     /// Send a message with retry logic for PrincipalTimeoutError
     ///
     /// This method will retry sending the message up to max_retries times if a
@@ -148,3 +190,139 @@ pub trait API: Into<ZmqMessage> + TryFrom<ZmqMessage> + TryFrom<String> + TryFro
         }
     }
 }
+
+/// Packs every batch_size messages into the frames of a single multipart message. The
+/// last batch holds whatever is left over when the messages don't divide evenly
+pub fn pack_batches(msgs: Vec<ZmqMessage>, batch_size: usize) -> Vec<ZmqMessage> {
+    let batch_size = batch_size.max(1);
+    let mut batches: Vec<ZmqMessage> = Vec::with_capacity(msgs.len().div_ceil(batch_size));
+    for (i, zmq_msg) in msgs.into_iter().enumerate() {
+        match batches.last_mut() {
+            Some(batch) if i % batch_size != 0 => {
+                for frame in zmq_msg.into_vec() {
+                    batch.push_back(frame);
+                }
+            }
+            _ => batches.push(zmq_msg),
+        }
+    }
+    batches
+}
+
+/// Unpacks the replies to batches made by pack_batches into a response for each of
+/// the total messages that were packed. Every message in a batch that failed, or
+/// whose reply doesn't have a frame for each message, gets an error
+pub fn unpack_batch_replies(
+    replies: Vec<Result<ZmqMessage, GenericError>>,
+    total: usize,
+    batch_size: usize,
+) -> Vec<Result<ClientResponseMessage, GenericError>> {
+    let batch_size = batch_size.max(1);
+    let mut responses = Vec::with_capacity(total);
+    for (i, reply) in replies.into_iter().enumerate() {
+        let expected = batch_size.min(total.saturating_sub(i * batch_size));
+        let err = match reply {
+            Ok(zmq_m) if zmq_m.len() == expected => {
+                responses.extend(
+                    zmq_m
+                        .into_vec()
+                        .into_iter()
+                        .map(|frame| Ok(ClientResponseMessage::from(ZmqMessage::from(frame)))),
+                );
+                continue;
+            }
+            Ok(zmq_m) => GenericError::ZMQParseError(ZMQParseError::ParseError(format!(
+                "Expected {} responses to batched requests but received {}",
+                expected,
+                zmq_m.len()
+            ))),
+            Err(GenericError::ZMQTimeoutError) => GenericError::PrincipalTimeoutError,
+            Err(e) => e,
+        };
+        for _ in 0..expected {
+            responses.push(Err(copy_batch_error(&err)));
+        }
+    }
+    // the replies should cover every message but don't leave any without a response
+    while responses.len() < total {
+        responses.push(Err(GenericError::ZMQError(String::from(
+            "No reply received for batched request",
+        ))));
+    }
+    responses
+}
+
+/// GenericError isn't Clone so this rebuilds the error for each message in a failed batch,
+/// keeping the variants that callers such as send_with_retry match on
+fn copy_batch_error(err: &GenericError) -> GenericError {
+    match err {
+        GenericError::PrincipalTimeoutError => GenericError::PrincipalTimeoutError,
+        GenericError::ZMQParseError(ZMQParseError::ParseError(msg)) => {
+            GenericError::ZMQParseError(ZMQParseError::ParseError(msg.clone()))
+        }
+        GenericError::ZMQError(msg) => GenericError::ZMQError(msg.clone()),
+        GenericError::RuntimeError(msg) => GenericError::RuntimeError(msg.clone()),
+        e => GenericError::ZMQError(e.to_string()),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn frames_as_strings(zmq_m: &ZmqMessage) -> Vec<String> {
+        zmq_m
+            .clone()
+            .into_vec()
+            .into_iter()
+            .map(|f| String::from_utf8(f.to_vec()).unwrap())
+            .collect()
+    }
+
+    #[test]
+    fn test_pack_batches_with_remainder() {
+        let msgs: Vec<ZmqMessage> = ["a", "b", "c", "d", "e"]
+            .into_iter()
+            .map(ZmqMessage::from)
+            .collect();
+        let batches = pack_batches(msgs, 2);
+        let batches: Vec<Vec<String>> = batches.iter().map(frames_as_strings).collect();
+        assert_eq!(batches, vec![vec!["a", "b"], vec!["c", "d"], vec!["e"]]);
+    }
+
+    #[test]
+    fn test_pack_batches_single() {
+        let msgs: Vec<ZmqMessage> = ["a", "b"].into_iter().map(ZmqMessage::from).collect();
+        let batches = pack_batches(msgs, 1);
+        assert_eq!(batches.len(), 2);
+        assert!(batches.iter().all(|b| b.len() == 1));
+    }
+
+    #[test]
+    fn test_unpack_batch_replies_keeps_replies_before_failure() {
+        let mut batch = ZmqMessage::from("OK");
+        batch.push_back("OK".into());
+        let replies = vec![Ok(batch), Err(GenericError::ZMQTimeoutError)];
+        let responses = unpack_batch_replies(replies, 3, 2);
+        assert_eq!(responses.len(), 3);
+        assert!(responses[0].is_ok());
+        assert!(responses[1].is_ok());
+        assert_eq!(responses[2], Err(GenericError::PrincipalTimeoutError));
+    }
+
+    #[test]
+    fn test_unpack_batch_replies_count_mismatch() {
+        let replies = vec![Ok(ZmqMessage::from("OK")), Ok(ZmqMessage::from("OK"))];
+        let responses = unpack_batch_replies(replies, 3, 2);
+        assert_eq!(responses.len(), 3);
+        assert!(matches!(
+            responses[0],
+            Err(GenericError::ZMQParseError(ZMQParseError::ParseError(_)))
+        ));
+        assert!(matches!(
+            responses[1],
+            Err(GenericError::ZMQParseError(ZMQParseError::ParseError(_)))
+        ));
+        assert!(responses[2].is_ok());
+    }
+}
@@ -2,6 +2,7 @@ use cdktr_api::{API, PrincipalAPI, models::ClientResponseMessage};
 use cdktr_ipc::log_manager::{client::LogsClient, model::LogMessage};
 use log::error;
 use log::info;
+use std::io::{self, BufWriter, Write};
 use std::time::SystemTime;
 
 /// Log management CLI
@@ -112,8 +113,16 @@ async fn query_logs(args: LogArgs) {
             ClientResponseMessage::SuccessWithPayload(payload) => {
                 let logs: Vec<String> =
                     serde_json::from_str(&payload).expect("Unable to read logs from API response");
+                // stdout is line buffered so write the logs through a single buffered
+                // writer rather than making a write call for every log line
+                let mut stdout = BufWriter::new(io::stdout().lock());
                 for log_msg in logs {
-                    println!("{}", log_msg)
+                    if let Err(e) = writeln!(stdout, "{}", log_msg) {
+                        return handle_write_error(e);
+                    }
+                }
+                if let Err(e) = stdout.flush() {
+                    handle_write_error(e)
                 }
             }
             other => error!("Unexpected response: {}", other.to_string()),
@@ -123,3 +132,11 @@ async fn query_logs(args: LogArgs) {
         }
     }
 }
+
+/// A closed pipe just means the reader has finished with the output (eg. piping
+/// to `head`) so it's not reported as an error
+fn handle_write_error(e: io::Error) {
+    if e.kind() != io::ErrorKind::BrokenPipe {
+        error!("Failed to write logs: {}", e.to_string())
+    }
+}
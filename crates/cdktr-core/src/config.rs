@@ -16,15 +16,30 @@ pub static CDKTR_RETRY_ATTEMPTS: usize = 20;
 /// default timeout for a zmq request
 pub static CDKTR_DEFAULT_ZMQ_TIMEOUT_MS: usize = 3_000;
 
+/// high water mark for queued zmq messages. Caps the number of requests a pipelined
+/// client can have awaiting a reply and the number of requests queued for each
+/// principal server worker before the sender has to wait
+pub static CDKTR_ZMQ_HWM: usize = 1_000;
+
 /// default refresh interval for the REP server
 pub static CDKTR_DEFAULT_ZMQ_REP_FREFRESH_INTERVAL_MS: usize = 3_000;
 
+/// number of workers taking client requests off the principal server socket. Requests
+/// from the same client are always handled by the same worker. The workers take turns
+/// running the request handlers so only one request updates the principal at a time
+pub static CDKTR_PRINCIPAL_SERVER_WORKERS: usize = 4;
+
 /// hostname of the principal instance
 pub static CDKTR_PRINCIPAL_HOST: &'static str = "0.0.0.0";
 
 /// default port of the principal instance
 pub static CDKTR_PRINCIPAL_PORT: usize = 5561;
 
+/// path of a unix socket the principal also listens on so clients on the same host
+/// can skip the loopback TCP stack. When set, clients connect to the principal
+/// over this socket instead of TCP. Not used if blank
+pub static CDKTR_PRINCIPAL_IPC_PATH: &'static str = "";
+
 /// listening port for the principal log manager
 pub static CDKTR_LOGS_LISTENING_PORT: usize = 5562;
 
@@ -99,7 +99,7 @@ impl ZMQArgs {
         self.inner.len()
     }
     pub fn to_string(&self) -> String {
-        self.clone().into()
+        vecd_to_arg_str(&self.inner)
     }
 }
 impl Into<Vec<String>> for ZMQArgs {
@@ -138,6 +138,15 @@ impl From<Vec<String>> for ZMQArgs {
 
 impl Into<ZMQArgs> for ZmqMessage {
     fn into(self) -> ZMQArgs {
+        // tokens are read straight from the frame rather than first copying the
+        // whole frame into a string
+        if self.len() == 1 {
+            if let Some(Ok(raw_str)) = self.get(0).map(|frame| std::str::from_utf8(frame)) {
+                return ZMQArgs {
+                    inner: arg_str_to_vecd(raw_str),
+                };
+            }
+        }
         let raw_msg = String::try_from(self);
         let raw_string = match raw_msg {
             Ok(s) => s,
@@ -12,7 +12,7 @@ pub mod data_structures;
 /// into a vecdeque of string tokens. No escape characters
 /// are used for SOH delimited strings so any messages containing
 /// SOH as values will be invalid
-pub fn arg_str_to_vecd(s: &String) -> VecDeque<String> {
+pub fn arg_str_to_vecd(s: &str) -> VecDeque<String> {
     s.split(ZMQ_MESSAGE_DELIMITER as char)
         .map(|s| s.to_string())
         .collect::<VecDeque<String>>()
@@ -22,7 +22,7 @@ pub fn arg_str_to_vecd(s: &String) -> VecDeque<String> {
 /// encode a series of string arguments as a pipe-delimited string
 /// adding escape \ where necessary
 pub fn vecd_to_arg_str(vecd: &VecDeque<String>) -> String {
-    format_zmq_msg_str(vecd.iter().map(|v| v.as_str()).collect::<Vec<&str>>())
+    format_zmq_msg_str(vecd.iter().map(String::as_str).collect())
 }
 
 pub fn get_instance_id() -> String {
@@ -36,13 +36,44 @@ pub fn str_or_blank<T: ToString>(s: Option<T>) -> String {
     }
 }
 
+/// uri clients use to reach the principal. The unix socket is only used when
+/// CDKTR_PRINCIPAL_IPC_PATH is set and the principal host is this machine, otherwise
+/// the configured host and port are used over tcp
 pub fn get_principal_uri() -> String {
+    let host = internal_get_cdktr_setting!(CDKTR_PRINCIPAL_HOST);
+    if is_local_host(&host) {
+        if let Some(ipc_uri) = get_principal_ipc_uri() {
+            return ipc_uri;
+        }
+    }
     get_server_tcp_uri(
-        &internal_get_cdktr_setting!(CDKTR_PRINCIPAL_HOST),
+        &host,
         internal_get_cdktr_setting!(CDKTR_PRINCIPAL_PORT, usize),
     )
 }
 
+/// uri of the unix socket the principal listens on if CDKTR_PRINCIPAL_IPC_PATH is set
+pub fn get_principal_ipc_uri() -> Option<String> {
+    ipc_uri_from_path(&internal_get_cdktr_setting!(CDKTR_PRINCIPAL_IPC_PATH))
+}
+
+fn ipc_uri_from_path(ipc_path: &str) -> Option<String> {
+    let ipc_path = ipc_path.trim();
+    if ipc_path.is_empty() {
+        None
+    } else {
+        Some(format!("ipc://{ipc_path}"))
+    }
+}
+
+/// whether the host refers to this machine so a unix socket can reach it
+fn is_local_host(host: &str) -> bool {
+    matches!(
+        host.trim(),
+        "localhost" | "127.0.0.1" | "0.0.0.0" | "::1" | "[::1]"
+    )
+}
+
 pub fn get_default_zmq_timeout() -> Duration {
     Duration::from_millis(internal_get_cdktr_setting!(CDKTR_DEFAULT_ZMQ_TIMEOUT_MS, usize) as u64)
 }
@@ -134,4 +165,31 @@ mod tests {
             ]
         )
     }
+
+    #[test]
+    fn test_ipc_uri_from_path() {
+        assert_eq!(ipc_uri_from_path(""), None);
+        assert_eq!(ipc_uri_from_path("  "), None);
+        assert_eq!(
+            ipc_uri_from_path("/tmp/cdktr.sock"),
+            Some("ipc:///tmp/cdktr.sock".to_string())
+        );
+    }
+
+    #[test]
+    fn test_get_principal_ipc_uri_blank_by_default() {
+        // CDKTR_PRINCIPAL_IPC_PATH defaults to blank so ipc is opt-in
+        if env::var("CDKTR_PRINCIPAL_IPC_PATH").is_err() {
+            assert_eq!(get_principal_ipc_uri(), None);
+        }
+    }
+
+    #[test]
+    fn test_is_local_host() {
+        assert!(is_local_host("localhost"));
+        assert!(is_local_host("127.0.0.1"));
+        assert!(is_local_host("0.0.0.0"));
+        assert!(!is_local_host("192.168.1.20"));
+        assert!(!is_local_host("principal.example.com"));
+    }
 }
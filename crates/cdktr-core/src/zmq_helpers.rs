@@ -7,8 +7,8 @@ use crate::{
 use log::warn;
 use tokio::time::timeout;
 use zeromq::{
-    PubSocket, PullSocket, PushSocket, RepSocket, ReqSocket, Socket, SocketRecv, SocketSend,
-    SubSocket, ZmqMessage,
+    DealerSocket, PubSocket, PullSocket, PushSocket, RepSocket, ReqSocket, RouterSocket, Socket,
+    SocketRecv, SocketSend, SubSocket, ZmqMessage,
 };
 
 pub static ZMQ_MESSAGE_DELIMITER: u8 = b'\x01';
@@ -21,6 +21,15 @@ pub async fn get_zmq_req(endpoint_uri: &str) -> Result<ReqSocket, GenericError>
     Ok(req)
 }
 
+pub async fn get_zmq_dealer(endpoint_uri: &str) -> Result<DealerSocket, GenericError> {
+    let mut dealer = DealerSocket::new();
+    dealer
+        .connect(endpoint_uri)
+        .await
+        .map_err(|e| GenericError::ZMQParseError(ZMQParseError::ParseError(e.to_string())))?;
+    Ok(dealer)
+}
+
 pub async fn get_zmq_rep(endpoint_uri: &str) -> Result<RepSocket, GenericError> {
     let mut rep = RepSocket::new();
     rep.bind(endpoint_uri)
@@ -29,6 +38,15 @@ pub async fn get_zmq_rep(endpoint_uri: &str) -> Result<RepSocket, GenericError>
     Ok(rep)
 }
 
+pub async fn get_zmq_router(endpoint_uri: &str) -> Result<RouterSocket, GenericError> {
+    let mut router = RouterSocket::new();
+    router
+        .bind(endpoint_uri)
+        .await
+        .map_err(|e| GenericError::ZMQParseError(ZMQParseError::ParseError(e.to_string())))?;
+    Ok(router)
+}
+
 pub async fn get_zmq_pub(endpoint_uri: &str) -> Result<PubSocket, GenericError> {
     let mut pub_socket = PubSocket::new();
     pub_socket
@@ -125,6 +143,122 @@ pub async fn send_recv_with_timeout(
     }
 }
 
+/// Sends a series of messages to a server over a single DEALER connection. The endpoint
+/// can be a tcp:// or ipc:// uri. Unlike send_recv_with_timeout, the next message is
+/// sent without waiting for the reply to the previous one so throughput isn't bound by
+/// the round trip of each request. At most CDKTR_ZMQ_HWM requests are left awaiting a
+/// reply at any one time.
+///
+/// Replies are returned in the order they arrive, which is only the order the messages
+/// were sent in if the server answers each connection's requests in order. A REP socket
+/// does this, as does a cdktr ROUTER server as it hands every request from one client
+/// to the same worker.
+///
+/// A result is returned for every message. If the connection fails or a reply doesn't
+/// arrive within the given duration, the replies already received are still returned
+/// and the rest of the messages get an error. A message that was sent but not replied
+/// to may still have been handled by the server so it gets a different error to a
+/// message that was never sent
+pub async fn send_pipelined_with_timeout(
+    endpoint_uri: String,
+    zmq_msgs: Vec<ZmqMessage>,
+    duration: Duration,
+) -> Vec<Result<ZmqMessage, GenericError>> {
+    let total = zmq_msgs.len();
+    let mut replies = Vec::with_capacity(total);
+    let mut sent = 0;
+    let failure =
+        match pipeline_requests(&endpoint_uri, zmq_msgs, duration, &mut replies, &mut sent).await {
+            Ok(()) => return replies,
+            Err(e) => e,
+        };
+    warn!(
+        "Pipelined requests to {} failed with {} of {} replies received: {}",
+        endpoint_uri,
+        replies.len(),
+        total,
+        failure.to_string()
+    );
+    for _ in replies.len()..sent {
+        replies.push(Err(match failure {
+            GenericError::ZMQTimeoutError => GenericError::ZMQTimeoutError,
+            ref e => GenericError::ZMQError(format!("No reply received: {}", e.to_string())),
+        }));
+    }
+    for _ in sent..total {
+        replies.push(Err(GenericError::RuntimeError(format!(
+            "Request was not sent: {}",
+            failure.to_string()
+        ))));
+    }
+    replies
+}
+
+/// Runs the send/recv loop for send_pipelined_with_timeout, adding each reply to
+/// replies as it arrives and keeping count of the messages that have been sent
+async fn pipeline_requests(
+    endpoint_uri: &str,
+    zmq_msgs: Vec<ZmqMessage>,
+    duration: Duration,
+    replies: &mut Vec<Result<ZmqMessage, GenericError>>,
+    sent: &mut usize,
+) -> Result<(), GenericError> {
+    let total = zmq_msgs.len();
+    if total == 0 {
+        return Ok(());
+    }
+    let mut dealer = timeout(duration, get_zmq_dealer(endpoint_uri))
+        .await
+        .map_err(|_e| GenericError::ZMQTimeoutError)??;
+    let max_in_flight = macros::internal_get_cdktr_setting!(CDKTR_ZMQ_HWM, usize).max(1);
+    let mut to_send = zmq_msgs.into_iter().peekable();
+    while replies.len() < total {
+        let in_flight = *sent - replies.len();
+        let can_send = in_flight < max_in_flight && to_send.peek().is_some();
+        if in_flight > 0 {
+            // when there's still room to send, only take a reply that has already
+            // arrived so sends carry on while the rest of the replies are in flight.
+            // Otherwise wait for the next reply, timing out if none arrives in time
+            let recv_wait = if can_send { Duration::ZERO } else { duration };
+            match timeout(recv_wait, dealer.recv()).await {
+                Ok(recv_res) => {
+                    let reply = recv_res.map_err(|e| {
+                        GenericError::ZMQParseError(ZMQParseError::ParseError(e.to_string()))
+                    })?;
+                    replies.push(strip_empty_delimiter(reply));
+                    continue;
+                }
+                Err(_e) if can_send => (),
+                Err(_e) => return Err(GenericError::ZMQTimeoutError),
+            }
+        }
+        if let Some(mut zmq_msg) = to_send.next() {
+            // counted before sending as a failed send may still have reached the server
+            *sent += 1;
+            // empty delimiter frame so the REP socket sees the same envelope a REQ socket sends
+            zmq_msg.push_front(Vec::<u8>::new().into());
+            timeout(duration, dealer.send(zmq_msg))
+                .await
+                .map_err(|_e| GenericError::ZMQTimeoutError)?
+                .map_err(|e| {
+                    GenericError::ZMQParseError(ZMQParseError::ParseError(e.to_string()))
+                })?;
+        }
+    }
+    Ok(())
+}
+
+/// removes the empty delimiter frame that a REP socket puts in front of
+/// replies sent to a DEALER socket
+fn strip_empty_delimiter(zmq_msg: ZmqMessage) -> Result<ZmqMessage, GenericError> {
+    let mut frames = zmq_msg.into_vec();
+    if frames.first().is_some_and(|frame| frame.is_empty()) {
+        frames.remove(0);
+    }
+    ZmqMessage::try_from(frames)
+        .map_err(|e| GenericError::ZMQParseError(ZMQParseError::ParseError(e.to_string())))
+}
+
 pub async fn push_with_timeout(
     push_socket: &mut PushSocket,
     duration: Duration,
@@ -159,7 +293,9 @@ pub async fn sub_with_timeout(
 }
 
 pub fn format_zmq_msg_str(args: Vec<&str>) -> String {
-    let mut zmq_str = String::new();
+    // sized up front for the args and delimiters so the string is only allocated once
+    let capacity = args.iter().map(|arg| arg.len()).sum::<usize>() + args.len();
+    let mut zmq_str = String::with_capacity(capacity);
     match args.len() {
         0 => zmq_str,
         1 => {
@@ -263,6 +399,86 @@ mod tests {
         )
     }
 
+    #[tokio::test]
+    async fn test_send_pipelined_with_timeout_keeps_order() {
+        let host = String::from("0.0.0.0");
+        let port = 9994;
+        let endpoint = get_server_tcp_uri(&host, port);
+        let mut rep = get_zmq_rep(&endpoint).await.unwrap();
+        tokio::spawn(async move {
+            for _ in 0..3 {
+                let msg = rep.recv().await.unwrap();
+                rep.send(msg).await.unwrap()
+            }
+        });
+        let msgs = vec!["first", "second", "third"];
+        let replies = send_pipelined_with_timeout(
+            endpoint,
+            msgs.iter().map(|m| ZmqMessage::from(*m)).collect(),
+            Duration::from_secs(1),
+        )
+        .await;
+        let replies: Vec<String> = replies
+            .into_iter()
+            .map(|r| String::try_from(r.unwrap()).unwrap())
+            .collect();
+        assert_eq!(replies, msgs)
+    }
+
+    #[tokio::test]
+    async fn test_send_pipelined_with_timeout_keeps_replies_on_failure() {
+        let host = String::from("0.0.0.0");
+        let port = 9993;
+        let endpoint = get_server_tcp_uri(&host, port);
+        let mut rep = get_zmq_rep(&endpoint).await.unwrap();
+        tokio::spawn(async move {
+            // only the first two requests are answered
+            for _ in 0..2 {
+                let msg = rep.recv().await.unwrap();
+                rep.send(msg).await.unwrap()
+            }
+            let _ = rep.recv().await;
+            sleep(Duration::from_secs(2)).await;
+        });
+        let msgs = vec!["first", "second", "third"];
+        let replies = send_pipelined_with_timeout(
+            endpoint,
+            msgs.iter().map(|m| ZmqMessage::from(*m)).collect(),
+            Duration::from_millis(500),
+        )
+        .await;
+        assert_eq!(replies.len(), 3);
+        assert_eq!(
+            String::try_from(replies[0].as_ref().unwrap().clone()).unwrap(),
+            "first"
+        );
+        assert_eq!(
+            String::try_from(replies[1].as_ref().unwrap().clone()).unwrap(),
+            "second"
+        );
+        assert!(matches!(replies[2], Err(GenericError::ZMQTimeoutError)))
+    }
+
+    #[tokio::test]
+    async fn test_send_pipelined_with_timeout_not_sent() {
+        let host = String::from("0.0.0.0");
+        let port = 9992;
+        let endpoint = get_server_tcp_uri(&host, port);
+        // nothing is listening so none of the requests can be sent
+        let replies = send_pipelined_with_timeout(
+            endpoint,
+            vec![ZmqMessage::from("first"), ZmqMessage::from("second")],
+            Duration::from_millis(200),
+        )
+        .await;
+        assert_eq!(replies.len(), 2);
+        assert!(
+            replies
+                .iter()
+                .all(|r| matches!(r, Err(GenericError::RuntimeError(_))))
+        )
+    }
+
     #[test]
     fn test_get_agent_tcp_uri() {
         let host = "localhost";
@@ -7,14 +7,17 @@ use crate::{
     },
     server::{
         principal::{PrincipalServer, helpers},
-        traits::Server,
+        traits::{Server, remove_ipc_socket_file},
     },
     taskmanager,
 };
 use cdktr_core::{
     exceptions::GenericError,
     get_cdktr_setting,
-    utils::data_structures::{AgentPriorityQueue, AsyncQueue},
+    utils::{
+        data_structures::{AgentPriorityQueue, AsyncQueue},
+        get_principal_ipc_uri,
+    },
 };
 use cdktr_db::DBClient;
 use cdktr_events::start_scheduler;
@@ -92,10 +95,14 @@ pub async fn start_principal(
         Ok::<(), GenericError>(())
     });
 
+    // clients on the same host can connect over a unix socket while remote
+    // clients still use tcp
+    let extra_endpoints: Vec<String> = get_principal_ipc_uri().into_iter().collect();
+
     // start REP/REQ server loop for principal
     m_joined.spawn(async move {
         principal_server
-            .start(&instance_host, instance_port)
+            .start_with_endpoints(&instance_host, instance_port, extra_endpoints)
             .await
             .expect("CDKTR: Unable to start client server");
         Ok::<(), GenericError>(())
@@ -119,7 +126,28 @@ pub async fn start_principal(
         Ok::<(), GenericError>(())
     });
 
-    let _ = m_joined.join_all().await;
+    let interrupted = tokio::select! {
+        _ = async {
+            while let Some(join_res) = m_joined.join_next().await {
+                if let Err(e) = join_res {
+                    if e.is_panic() {
+                        std::panic::resume_unwind(e.into_panic());
+                    }
+                }
+            }
+        } => false,
+        _ = tokio::signal::ctrl_c() => true,
+    };
+    if interrupted {
+        info!("Interrupt received - shutting down principal");
+        // abort the tasks and wait for them to finish so the sockets they own are
+        // closed rather than being left for process exit to clean up
+        m_joined.shutdown().await;
+        if let Some(ipc_uri) = get_principal_ipc_uri() {
+            remove_ipc_socket_file(ipc_uri.trim_start_matches("ipc://"));
+        }
+        std::process::exit(0);
+    }
     std::process::exit(1); // loop has broken
 }
 
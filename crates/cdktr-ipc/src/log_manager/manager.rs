@@ -4,10 +4,15 @@ use cdktr_core::{
     zmq_helpers::{get_server_tcp_uri, get_zmq_pub, get_zmq_pull},
 };
 use log::{debug, info, trace, warn};
-use zeromq::{PubSocket, PullSocket, SocketRecv, SocketSend};
+use tokio::sync::mpsc;
+use zeromq::{PubSocket, PullSocket, SocketRecv, SocketSend, ZmqMessage};
 
 use crate::log_manager::model::LogMessage;
 
+/// max number of validated log messages waiting to be published before the
+/// log manager stops reading from the pull socket
+const PUBLISH_QUEUE_SIZE: usize = 1024;
+
 /// This module provides the LogManager which is responsible for managing
 /// the logging system of the CDKTR application.
 /// Each agent will publish log messages to the log manager pull socket,
@@ -36,30 +41,50 @@ impl LogManager {
 
     pub async fn start(&mut self) {
         info!("LogManager started, listening for log messages from agents...");
-        loop {
-            match self.pull_socket.recv().await {
-                Ok(msg) => {
-                    let log_message: LogMessage = match LogMessage::try_from(msg) {
-                        Ok(log_msg) => log_msg,
-                        Err(e) => {
-                            debug!("Failed to parse log message: {}", e);
-                            dbg!(e);
-                            continue;
+        // receiving and publishing run side by side so validating the next message
+        // isn't held up waiting on the pub socket to send the previous one
+        let (publish_tx, mut publish_rx) = mpsc::channel::<ZmqMessage>(PUBLISH_QUEUE_SIZE);
+        let pull_socket = &mut self.pull_socket;
+        let pub_socket = &mut self.pub_socket;
+        let receive_loop = async move {
+            loop {
+                match pull_socket.recv().await {
+                    Ok(msg) => {
+                        // parse a clone to validate the message. Cloning only bumps the reference
+                        // count of each frame so the original can be forwarded to the pub socket
+                        // as is instead of being re-encoded and copied for every message
+                        let log_message: LogMessage = match LogMessage::try_from(msg.clone()) {
+                            Ok(log_msg) => log_msg,
+                            Err(e) => {
+                                debug!("Failed to parse log message: {}", e);
+                                dbg!(e);
+                                continue;
+                            }
+                        };
+                        trace!(
+                            "Received log message on topic {}: {}",
+                            &log_message.workflow_instance_id, &log_message.payload
+                        );
+                        // hand the message to the publish loop, waiting if it's fallen behind
+                        if publish_tx.send(msg).await.is_err() {
+                            warn!("Log publishing has stopped");
+                            break;
                         }
-                    };
-                    trace!(
-                        "Received log message on topic {}: {}",
-                        &log_message.workflow_instance_id, &log_message.payload
-                    );
-                    // Publish the log message to the pub socket
-                    if let Err(e) = self.pub_socket.send(log_message.into()).await {
-                        warn!("Failed to publish log message: {}", e);
+                    }
+                    Err(e) => {
+                        warn!("Error receiving message: {}", e);
                     }
                 }
-                Err(e) => {
-                    warn!("Error receiving message: {}", e);
+            }
+        };
+        let publish_loop = async move {
+            while let Some(msg) = publish_rx.recv().await {
+                // Publish the log message to the pub socket
+                if let Err(e) = pub_socket.send(msg).await {
+                    warn!("Failed to publish log message: {}", e);
                 }
             }
-        }
+        };
+        tokio::join!(receive_loop, publish_loop);
     }
 }
@@ -20,6 +20,7 @@ use cdktr_api::models::ClientResponseMessage;
 
 pub mod helpers;
 
+#[derive(Clone)]
 pub struct PrincipalServer {
     #[allow(dead_code)]
     instance_id: String,
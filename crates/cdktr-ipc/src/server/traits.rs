@@ -1,81 +1,468 @@
-use std::time::{Duration, SystemTime};
+use std::collections::hash_map::DefaultHasher;
+use std::hash::{Hash, Hasher};
+use std::sync::Arc;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::time::Duration;
 
 use async_trait::async_trait;
 use cdktr_api::models::ClientResponseMessage;
 use cdktr_core::exceptions::GenericError;
 use cdktr_core::get_cdktr_setting;
-use cdktr_core::zmq_helpers::{get_server_tcp_uri, get_zmq_rep};
-use log::info;
+use cdktr_core::zmq_helpers::{get_server_tcp_uri, get_zmq_router};
+use log::{debug, info, warn};
+use tokio::sync::{Mutex, mpsc};
+use tokio::time::{Instant, Interval, MissedTickBehavior, interval_at};
 
-use zeromq::{Socket, ZmqMessage};
+use zeromq::{RouterSocket, Socket, ZmqMessage};
 use zeromq::{SocketRecv, SocketSend};
 
-/// A standard ZMQ REP server that both the Agent and Principal instances
+/// A standard ZMQ server that both the Agent and Principal instances
 /// implement
 #[async_trait]
-pub trait Server<RT>
+pub trait Server<RT>: Clone + Send + 'static
 where
-    RT: TryFrom<ZmqMessage, Error = GenericError> + Send,
+    RT: TryFrom<ZmqMessage, Error = GenericError> + Send + 'static,
 {
     /// Method to handle the client request. It returns a tuple of ClientResponseMessage
     /// and a restart flag. This flag is used to determine whether the
     /// instance should be restarted or not
     async fn handle_client_message(&mut self, cli_msg: RT) -> (ClientResponseMessage, usize);
 
-    /// Method to run the REP listening loop. This is a default
+    /// Method to run the listening loop. This is a default
     /// implementation and is exactly the same for both the Agent
     /// and Principal instances so it is not needed to override this
     /// implmentation.
+    ///
+    /// A ROUTER socket receives the client requests and hands them off to a pool of
+    /// workers so that the socket I/O isn't held up by a slow request. Requests from the
+    /// same client are always handed to the same worker so the replies to a client that
+    /// pipelines its requests come back in order. The workers share the one server and
+    /// only one request is handled at a time as the handlers aren't written to run
+    /// concurrently with each other.
     async fn start(&mut self, current_host: &str, rep_port: usize) -> Result<usize, GenericError> {
+        self.start_with_endpoints(current_host, rep_port, Vec::new())
+            .await
+    }
+
+    /// Same as start but the ROUTER socket is also bound to each of the extra
+    /// endpoints given, such as a unix socket for clients on the same host
+    async fn start_with_endpoints(
+        &mut self,
+        current_host: &str,
+        rep_port: usize,
+        extra_endpoints: Vec<String>,
+    ) -> Result<usize, GenericError> {
         info!(
-            "SERVER: Starting REP Server on tcp://{}:{}",
+            "SERVER: Starting ROUTER Server on tcp://{}:{}",
             current_host, rep_port
         );
-        let mut rep_socket = get_zmq_rep(&get_server_tcp_uri(current_host, rep_port)).await?;
-        let rep_socket_refresh_fequency_ms =
-            get_cdktr_setting!(CDKTR_DEFAULT_ZMQ_REP_FREFRESH_INTERVAL_MS, usize) as u64;
-        let mut last_rep_socket_refresh_time = SystemTime::now();
-        info!("SERVER: Successfully connected");
-
-        let exit_code = loop {
-            let zmq_recv = rep_socket
-                .recv()
+        let mut router_socket = get_zmq_router(&get_server_tcp_uri(current_host, rep_port)).await?;
+        for endpoint in extra_endpoints {
+            info!("SERVER: Also listening on {}", endpoint);
+            // only cleared once the tcp bind has succeeded so a second instance started
+            // by mistake fails before it can remove a running instance's socket file
+            if let Some(ipc_path) = endpoint.strip_prefix("ipc://") {
+                remove_ipc_socket_file(ipc_path);
+            }
+            router_socket
+                .bind(&endpoint)
                 .await
                 .map_err(|e| GenericError::ZMQError(e.to_string()))?;
-            let msg_res: Result<RT, GenericError> = RT::try_from(zmq_recv.clone());
-            match msg_res {
-                Ok(cli_msg) => {
-                    let (response, exit_code) = self.handle_client_message(cli_msg).await;
-                    let _ = rep_socket.send(response.into()).await;
-                    if exit_code > 0 {
-                        // received a non-zero exit code from the message handling function
-                        // which means the server should perform some other kind of action
-                        // above the client/request loop so loop should be exited
-                        break exit_code;
+        }
+        let socket_refresh_interval = Duration::from_millis(get_cdktr_setting!(
+            CDKTR_DEFAULT_ZMQ_REP_FREFRESH_INTERVAL_MS,
+            usize
+        ) as u64);
+        serve::<Self, RT>(
+            self.clone(),
+            router_socket,
+            SocketRefresh::new(socket_refresh_interval),
+        )
+        .await
+    }
+}
+
+/// Runs the ROUTER loop for Server::start, handing requests to the workers and
+/// sending their replies back out until a handler returns a non-zero exit code
+async fn serve<S, RT>(
+    server: S,
+    mut router_socket: RouterSocket,
+    mut socket_refresh: SocketRefresh,
+) -> Result<usize, GenericError>
+where
+    S: Server<RT>,
+    RT: TryFrom<ZmqMessage, Error = GenericError> + Send + 'static,
+{
+    let worker_count = get_cdktr_setting!(CDKTR_PRINCIPAL_SERVER_WORKERS, usize).max(1);
+    // max number of requests queued for a single worker before the server
+    // stops reading from the socket
+    let worker_queue_size = get_cdktr_setting!(CDKTR_ZMQ_HWM, usize).max(1);
+    // replies are unbounded as they're already limited by the size of the worker queues
+    let (reply_tx, mut reply_rx) = mpsc::unbounded_channel();
+    let server = Arc::new(Mutex::new(server));
+    let mut worker_txs = Vec::with_capacity(worker_count);
+    for _ in 0..worker_count {
+        let (request_tx, request_rx) = mpsc::channel(worker_queue_size);
+        worker_txs.push(request_tx);
+        tokio::spawn(server_worker::<S, RT>(
+            server.clone(),
+            request_rx,
+            reply_tx.clone(),
+        ));
+    }
+    info!(
+        "SERVER: Successfully connected with {} workers",
+        worker_count
+    );
+
+    // requests handed to a worker that haven't been replied to yet. The socket is
+    // only refreshed when this is zero so a client is never dropped while it's
+    // still waiting on a reply
+    let mut awaiting_reply: usize = 0;
+    let exit_code = loop {
+        tokio::select! {
+            recv_res = router_socket.recv() => {
+                let zmq_recv = recv_res.map_err(|e| GenericError::ZMQError(e.to_string()))?;
+                let worker_tx = &worker_txs[worker_index(&zmq_recv, worker_count)];
+                if worker_tx.send(zmq_recv).await.is_err() {
+                    return Err(GenericError::RuntimeError(
+                        "Server worker has stopped".to_string(),
+                    ));
+                };
+                awaiting_reply += 1;
+            }
+            Some((reply, exit_code)) = reply_rx.recv() => {
+                awaiting_reply = awaiting_reply.saturating_sub(1);
+                if let Some(reply) = reply {
+                    if let Err(e) = router_socket.send(reply).await {
+                        warn!("SERVER: Failed to send reply to client: {}", e.to_string());
                     };
                 }
-                Err(e) => {
-                    let error_msg = e.to_string();
-                    let response = ClientResponseMessage::ClientError(error_msg);
-                    rep_socket
-                        .send(response.into())
-                        .await
-                        .map_err(|e| GenericError::ZMQError(e.to_string()))?;
-                }
-            };
+                if exit_code > 0 {
+                    // received a non-zero exit code from the message handling function
+                    // which means the server should perform some other kind of action
+                    // above the client/request loop so loop should be exited
+                    break exit_code;
+                };
+            }
+            _ = socket_refresh.tick() => (),
+        }
+        socket_refresh.refresh_if_due(&mut router_socket, awaiting_reply);
+    };
+    Ok(exit_code)
+}
+
+/// Refreshes the ROUTER socket to prevent FD leak from new connections. The refresh
+/// falls due once every interval, however busy the server is, but is held back until
+/// no request is awaiting a reply so that no client is dropped mid-conversation
+/// TODO: not an ideal solution. Need to fix reqs to re-use sockets as much as possible to avoid doing this so frequently
+struct SocketRefresh {
+    interval: Interval,
+    due: bool,
+    refreshes: Arc<AtomicUsize>,
+}
+
+impl SocketRefresh {
+    fn new(period: Duration) -> Self {
+        let mut interval = interval_at(Instant::now() + period, period);
+        interval.set_missed_tick_behavior(MissedTickBehavior::Delay);
+        Self {
+            interval,
+            due: false,
+            refreshes: Arc::new(AtomicUsize::new(0)),
+        }
+    }
+
+    /// Count of the refreshes done so far
+    #[cfg(test)]
+    fn refreshes(&self) -> Arc<AtomicUsize> {
+        self.refreshes.clone()
+    }
+
+    /// Waits for the next interval to pass and marks the refresh as due
+    async fn tick(&mut self) {
+        self.interval.tick().await;
+        self.due = true;
+    }
+
+    fn refresh_if_due(&mut self, router_socket: &mut RouterSocket, awaiting_reply: usize) {
+        if self.due && awaiting_reply == 0 {
+            router_socket.backend().shutdown();
+            self.due = false;
+            let refreshes = self.refreshes.fetch_add(1, Ordering::Relaxed) + 1;
+            debug!("SERVER: Refreshed socket ({} refreshes)", refreshes);
+        }
+    }
+}
+
+/// Removes a unix socket file. A file left behind by a previous run has to be
+/// cleared out or binding to it fails
+pub(crate) fn remove_ipc_socket_file(ipc_path: &str) {
+    if let Err(e) = std::fs::remove_file(ipc_path) {
+        if e.kind() != std::io::ErrorKind::NotFound {
+            warn!(
+                "SERVER: Unable to remove existing socket file {}: {}",
+                ipc_path, e
+            );
+        }
+    };
+}
+
+/// Picks the worker for a request received on the ROUTER socket from the
+/// identity of the client that sent it
+fn worker_index(zmq_msg: &ZmqMessage, worker_count: usize) -> usize {
+    let mut hasher = DefaultHasher::new();
+    zmq_msg.get(0).hash(&mut hasher);
+    (hasher.finish() as usize) % worker_count
+}
 
-            // fix to refresh the rep socket to prevent FD leak from new connections
-            // done in this loop to avoid any potential dropped messages
-            // TODO: not an ideal solution. Need to fix reqs to re-use sockets as much as possible to avoid doing this so frequently
-            if SystemTime::now()
-                .duration_since(last_rep_socket_refresh_time)
-                .expect("failed to get duration for rep socket refresh")
-                > Duration::from_millis(rep_socket_refresh_fequency_ms)
-            {
-                rep_socket.backend().shutdown();
-                last_rep_socket_refresh_time = SystemTime::now();
+/// Handles the requests handed to it by the ROUTER loop and passes the replies back
+/// with the routing envelope of the original request so they reach the right client
+async fn server_worker<S, RT>(
+    server: Arc<Mutex<S>>,
+    mut request_rx: mpsc::Receiver<ZmqMessage>,
+    reply_tx: mpsc::UnboundedSender<(Option<ZmqMessage>, usize)>,
+) where
+    S: Server<RT>,
+    RT: TryFrom<ZmqMessage, Error = GenericError> + Send + 'static,
+{
+    while let Some(zmq_msg) = request_rx.recv().await {
+        let mut frames = zmq_msg.into_vec();
+        // the envelope is the client identity up to and including the empty delimiter frame
+        let body_start = frames
+            .iter()
+            .position(|frame| frame.is_empty())
+            .map_or(1, |i| i + 1)
+            .min(frames.len());
+        let body = frames.split_off(body_start);
+        if body.is_empty() {
+            let response: ZmqMessage =
+                ClientResponseMessage::ClientError("Cannot work with an empty message".to_string())
+                    .into();
+            frames.extend(response.into_vec());
+        }
+        // each frame of the body is handled as a separate request so clients can batch
+        // several requests into one multipart message. The reply has a frame per request
+        let mut exit_code = 0;
+        for frame in body {
+            let (response, frame_exit_code) = match RT::try_from(ZmqMessage::from(frame)) {
+                // the lock is held for the whole request so that handlers which update
+                // shared state in several steps, like the agent queue, don't interleave
+                Ok(cli_msg) => server.lock().await.handle_client_message(cli_msg).await,
+                Err(e) => (ClientResponseMessage::ClientError(e.to_string()), 0),
+            };
+            exit_code = exit_code.max(frame_exit_code);
+            let response: ZmqMessage = response.into();
+            frames.extend(response.into_vec());
+        }
+        // the ROUTER loop is still told when a reply can't be built so it
+        // doesn't count the request as awaiting a reply
+        let reply = match ZmqMessage::try_from(frames) {
+            Ok(reply) => Some(reply),
+            Err(e) => {
+                warn!("SERVER: Unable to build reply for client: {}", e);
+                None
             }
         };
-        Ok(exit_code)
+        if reply_tx.send((reply, exit_code)).is_err() {
+            break;
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::server::principal::PrincipalServer;
+    use cdktr_api::{PrincipalAPI, pack_batches, unpack_batch_replies};
+    use cdktr_core::models::RunStatus;
+    use cdktr_core::zmq_helpers::{send_pipelined_with_timeout, send_recv_with_timeout};
+    use cdktr_db::DBClient;
+    use cdktr_workflow::WorkflowStore;
+    use tokio::time::sleep;
+
+    async fn get_principal_server() -> PrincipalServer {
+        PrincipalServer::new(
+            "fake_ins".to_string(),
+            WorkflowStore::from_dir("./test_artifacts/workflows")
+                .await
+                .unwrap(),
+            DBClient::new(None).unwrap(),
+        )
+    }
+
+    async fn serve_principal(port: usize, socket_refresh: SocketRefresh) -> String {
+        let server = get_principal_server().await;
+        let router_socket = get_zmq_router(&get_server_tcp_uri("0.0.0.0", port))
+            .await
+            .unwrap();
+        tokio::spawn(serve::<PrincipalServer, PrincipalAPI>(
+            server,
+            router_socket,
+            socket_refresh,
+        ));
+        get_server_tcp_uri("127.0.0.1", port)
+    }
+
+    #[tokio::test]
+    async fn test_serve_replies_after_socket_refresh() {
+        let uri = serve_principal(9990, SocketRefresh::new(Duration::from_millis(100))).await;
+        let reply = send_recv_with_timeout(
+            uri.clone(),
+            PrincipalAPI::Ping.into(),
+            Duration::from_secs(1),
+        )
+        .await
+        .unwrap();
+        assert_eq!(
+            ClientResponseMessage::from(reply),
+            ClientResponseMessage::Pong
+        );
+        // idle for longer than the refresh interval so the socket is refreshed
+        // before the next request arrives
+        sleep(Duration::from_millis(300)).await;
+        let reply = send_recv_with_timeout(uri, PrincipalAPI::Ping.into(), Duration::from_secs(1))
+            .await
+            .unwrap();
+        assert_eq!(
+            ClientResponseMessage::from(reply),
+            ClientResponseMessage::Pong
+        );
+    }
+
+    #[test]
+    fn test_worker_index_same_client_same_worker() {
+        let mut first = ZmqMessage::from("PING");
+        first.push_front(Vec::<u8>::new().into());
+        first.push_front(b"client-1".to_vec().into());
+        let mut second = ZmqMessage::from("LSWORKFLOWS");
+        second.push_front(Vec::<u8>::new().into());
+        second.push_front(b"client-1".to_vec().into());
+        assert_eq!(worker_index(&first, 4), worker_index(&second, 4));
+        assert!(worker_index(&first, 4) < 4);
+    }
+
+    #[tokio::test]
+    async fn test_serve_refreshes_socket_while_busy() {
+        let socket_refresh = SocketRefresh::new(Duration::from_millis(100));
+        let refreshes = socket_refresh.refreshes();
+        let uri = serve_principal(9987, socket_refresh).await;
+        // requests keep arriving far more often than the refresh interval so the
+        // server is never idle for a whole interval
+        for _ in 0..25 {
+            let reply = send_recv_with_timeout(
+                uri.clone(),
+                PrincipalAPI::Ping.into(),
+                Duration::from_secs(1),
+            )
+            .await
+            .unwrap();
+            assert_eq!(
+                ClientResponseMessage::from(reply),
+                ClientResponseMessage::Pong
+            );
+            sleep(Duration::from_millis(20)).await;
+        }
+        assert!(refreshes.load(Ordering::Relaxed) >= 2);
+    }
+
+    #[tokio::test]
+    async fn test_serve_batched_replies_in_order() {
+        let uri = serve_principal(9991, SocketRefresh::new(Duration::from_secs(60))).await;
+        let msgs: Vec<ZmqMessage> = ["PING", "NOTAREQUEST", "PING", "PING", "PING"]
+            .into_iter()
+            .map(ZmqMessage::from)
+            .collect();
+        let batches = pack_batches(msgs, 2);
+        let frame_counts: Vec<usize> = batches.iter().map(|b| b.len()).collect();
+        assert_eq!(frame_counts, vec![2, 2, 1]);
+
+        let replies = send_pipelined_with_timeout(uri, batches, Duration::from_secs(1)).await;
+        assert_eq!(replies.len(), 3);
+        let reply_counts: Vec<usize> = replies.iter().map(|r| r.as_ref().unwrap().len()).collect();
+        assert_eq!(reply_counts, vec![2, 2, 1]);
+
+        let responses: Vec<ClientResponseMessage> = unpack_batch_replies(replies, 5, 2)
+            .into_iter()
+            .map(|r| r.unwrap())
+            .collect();
+        assert_eq!(responses.len(), 5);
+        assert_eq!(responses[0], ClientResponseMessage::Pong);
+        assert!(matches!(
+            responses[1],
+            ClientResponseMessage::ClientError(_)
+        ));
+        for response in &responses[2..] {
+            assert_eq!(*response, ClientResponseMessage::Pong);
+        }
+    }
+
+    #[tokio::test]
+    async fn test_start_keeps_socket_file_when_tcp_bind_fails() {
+        let port = 9989;
+        let _running = get_zmq_router(&get_server_tcp_uri("0.0.0.0", port))
+            .await
+            .unwrap();
+        let ipc_path = std::env::temp_dir().join("cdktr-test-start-keeps-socket-file.sock");
+        std::fs::write(&ipc_path, b"").unwrap();
+        let ipc_uri = format!("ipc://{}", ipc_path.display());
+
+        let mut server = get_principal_server().await;
+        let start_res = server
+            .start_with_endpoints("0.0.0.0", port, vec![ipc_uri])
+            .await;
+        assert!(start_res.is_err());
+        assert!(ipc_path.exists());
+        std::fs::remove_file(ipc_path).unwrap();
+    }
+
+    #[tokio::test]
+    async fn test_serve_concurrent_status_updates_same_agent() {
+        let server = get_principal_server().await;
+        let (live_agents, _agent_workflows, _db_client) = server.get_agent_tracking();
+        let router_socket = get_zmq_router(&get_server_tcp_uri("0.0.0.0", 9988))
+            .await
+            .unwrap();
+        tokio::spawn(serve::<PrincipalServer, PrincipalAPI>(
+            server,
+            router_socket,
+            SocketRefresh::new(Duration::from_secs(60)),
+        ));
+        let uri = get_server_tcp_uri("127.0.0.1", 9988);
+        let agent_id = "test-agent-001".to_string();
+        send_recv_with_timeout(
+            uri.clone(),
+            PrincipalAPI::RegisterAgent(agent_id.clone()).into(),
+            Duration::from_secs(1),
+        )
+        .await
+        .unwrap();
+
+        // every request is sent on its own REQ socket, as the agents do, so they
+        // have different identities and are spread across the workers
+        let update_count = 20;
+        let mut requests = tokio::task::JoinSet::new();
+        for i in 0..update_count {
+            let msgs = [
+                PrincipalAPI::WorkflowStatusUpdate(
+                    agent_id.clone(),
+                    "test-workflow".to_string(),
+                    format!("test-instance-{i}"),
+                    RunStatus::RUNNING,
+                ),
+                PrincipalAPI::RegisterAgent(agent_id.clone()),
+            ];
+            for msg in msgs {
+                let uri = uri.clone();
+                requests.spawn(async move {
+                    send_recv_with_timeout(uri, msg.into(), Duration::from_secs(5)).await
+                });
+            }
+        }
+        while let Some(res) = requests.join_next().await {
+            res.unwrap().unwrap();
+        }
+        let agent = live_agents.get_agent(&agent_id).await.unwrap();
+        assert_eq!(agent.utilisation(), update_count);
     }
 }
@@ -177,7 +177,16 @@ impl TaskManager {
             let agent_id = self.instance_id.clone();
             let workflow_id = workflow.id().clone();
             let _wf_handle: JoinHandle<Result<(), GenericError>> = tokio::spawn(async move {
-                let workflow_instance_id = { name_gen_cl.lock().await.next() };
+                // all the ids this workflow needs are generated under a single lock rather
+                // than contending for the generator again for each task that's started
+                let (workflow_instance_id, mut task_execution_ids) = {
+                    let mut name_gen = name_gen_cl.lock().await;
+                    let workflow_instance_id = name_gen.next();
+                    let task_execution_ids: Vec<String> = (0..workflow.get_dag().node_count())
+                        .map(|_| name_gen.next())
+                        .collect();
+                    (workflow_instance_id, task_execution_ids.into_iter())
+                };
                 if PrincipalAPI::WorkflowStatusUpdate(
                     agent_id.clone(),
                     workflow_id.clone(),
@@ -212,7 +221,10 @@ impl TaskManager {
                     let task = (&workflow).get_task(&task_id).expect(
                         "Passed an incorrect task id to the workflow from the task mgr - this is a bug",
                     );
-                    let task_execution_id = { name_gen_cl.lock().await.next() };
+                    let task_execution_id = match task_execution_ids.next() {
+                        Some(task_execution_id) => task_execution_id,
+                        None => name_gen_cl.lock().await.next(),
+                    };
                     let task_name = task.name().to_string();
                     PrincipalAPI::TaskStatusUpdate(
                         agent_id.clone(),
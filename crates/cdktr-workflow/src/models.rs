@@ -15,12 +15,15 @@ pub fn key_from_path(path: PathBuf, workflow_dir: PathBuf) -> String {
     path.strip_prefix(workflow_dir)
         .ok()
         .map(|relative_path| {
-            relative_path
-                .with_extension("") // Remove extension
-                .components()
-                .map(|c| c.as_os_str().to_string_lossy())
-                .collect::<Vec<_>>()
-                .join(".")
+            let mut key = String::new();
+            // Remove extension
+            for c in relative_path.with_extension("").components() {
+                if !key.is_empty() {
+                    key.push('.');
+                }
+                key.push_str(&c.as_os_str().to_string_lossy());
+            }
+            key
         })
         .unwrap()
 }
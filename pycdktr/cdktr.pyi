@@ -88,6 +88,27 @@ class Principal:
         """
         ...
 
+    def run_workflows(
+        self,
+        workflow_ids: list[str],
+        batch_size: Optional[int] = None
+    ) -> list[Result]:
+        """
+        Run a batch of workflows by ID.
+
+        The requests are pipelined over a single connection to the principal
+        so large batches are not bound by the round trip of each request.
+
+        Args:
+            workflow_ids: The IDs of the workflows to run.
+            batch_size: Optional number of requests to pack into each message
+                sent to the principal. Defaults to one request per message.
+
+        Returns:
+            A Result for each workflow, in the same order as workflow_ids.
+        """
+        ...
+
     def query_logs(
         self,
         start_timestamp_ms: Optional[int] = None,
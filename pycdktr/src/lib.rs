@@ -1,8 +1,45 @@
 use cdktr_api::{API, PrincipalAPI, models::ClientResponseMessage};
+use log::warn;
 use pyo3::exceptions::PyRuntimeError;
 use pyo3::prelude::*;
 use pyo3::types::{PyDict, PyList, PyString};
 use serde_json::Value as JsonValue;
+use std::sync::{Arc, Mutex};
+
+/// Runtime shared by every API call in the process so that each call doesn't
+/// have to start up and tear down its own set of worker threads. It's held with
+/// the id of the process that created it so a forked process can tell it's not its own
+static RUNTIME: Mutex<Option<(u32, Arc<tokio::runtime::Runtime>)>> = Mutex::new(None);
+
+/// Gets the shared runtime, creating it on first use. A process forked from the one
+/// that created the runtime (eg. by multiprocessing) inherits the runtime but none of
+/// its worker threads, so calls would hang on it. The child gets its own runtime instead
+fn runtime() -> PyResult<Arc<tokio::runtime::Runtime>> {
+    let mut shared = RUNTIME.lock().unwrap_or_else(|e| e.into_inner());
+    let pid = std::process::id();
+    if let Some((owner_pid, rt)) = shared.as_ref() {
+        if *owner_pid == pid {
+            return Ok(rt.clone());
+        }
+    }
+    if let Some((_owner_pid, stale_rt)) = shared.take() {
+        // the stale runtime's threads don't exist in this process so dropping it would
+        // wait on threads that never finish. It's leaked instead
+        std::mem::forget(stale_rt);
+    }
+    let worker_threads = std::thread::available_parallelism()
+        .map_or(1, |n| n.get())
+        .min(4);
+    let rt = Arc::new(
+        tokio::runtime::Builder::new_multi_thread()
+            .worker_threads(worker_threads)
+            .enable_all()
+            .build()
+            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?,
+    );
+    *shared = Some((pid, rt.clone()));
+    Ok(rt)
+}
 
 /// Result returned from Principal API calls
 #[pyclass]
@@ -113,6 +150,20 @@ impl Result {
     }
 }
 
+/// Sends a request to the principal and converts the response. The GIL is released
+/// while waiting on the principal so other Python threads can carry on running
+fn send_request(py: Python, api: PrincipalAPI) -> PyResult<Result> {
+    let rt = runtime()?;
+    match py.allow_threads(|| rt.block_on(api.send())) {
+        Ok(msg) => Result::from_response_with_py(py, msg),
+        Err(e) => Ok(Result {
+            success: false,
+            error: Some(e.to_string()),
+            payload: None,
+        }),
+    }
+}
+
 /// Python wrapper for the Principal API client
 #[pyclass]
 pub struct Principal {
@@ -124,65 +175,69 @@ pub struct Principal {
 impl Principal {
     #[new]
     #[pyo3(signature = (host="localhost".to_string(), port=5561))]
-    fn new(host: String, port: u16) -> Self {
+    fn new(py: Python, host: String, port: u16) -> PyResult<Self> {
         // Set environment variable for the Rust code to use
         std::env::set_var("CDKTR_PRINCIPAL_HOST", &host);
         std::env::set_var("CDKTR_PRINCIPAL_PORT", port.to_string());
-        Self { host, port }
+        // warm up the runtime and the route to the principal with a ping so the first
+        // real request doesn't pay for them. The principal may not be up yet so a
+        // failed ping is only logged
+        let rt = runtime()?;
+        if let Err(e) = py.allow_threads(|| rt.block_on(PrincipalAPI::Ping.send())) {
+            warn!(
+                "Unable to reach principal at {}:{} - {}",
+                host,
+                port,
+                e.to_string()
+            );
+        }
+        Ok(Self { host, port })
     }
 
     /// Ping the principal to check if it's online
     fn ping(&self, py: Python) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
-
-        rt.block_on(async {
-            let api = PrincipalAPI::Ping;
-            match api.send().await {
-                Ok(msg) => Result::from_response_with_py(py, msg),
-                Err(e) => Ok(Result {
-                    success: false,
-                    error: Some(e.to_string()),
-                    payload: None,
-                }),
-            }
-        })
+        send_request(py, PrincipalAPI::Ping)
     }
 
     /// List all workflows in the workflow store
     fn list_workflows(&self, py: Python) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
-
-        rt.block_on(async {
-            let api = PrincipalAPI::ListWorkflowStore;
-            match api.send().await {
-                Ok(msg) => Result::from_response_with_py(py, msg),
-                Err(e) => Ok(Result {
-                    success: false,
-                    error: Some(e.to_string()),
-                    payload: None,
-                }),
-            }
-        })
+        send_request(py, PrincipalAPI::ListWorkflowStore)
     }
 
     /// Run a workflow by ID
     fn run_workflow(&self, py: Python, workflow_id: String) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
+        send_request(py, PrincipalAPI::RunTask(workflow_id))
+    }
 
-        rt.block_on(async {
-            let api = PrincipalAPI::RunTask(workflow_id);
-            match api.send().await {
+    /// Run a batch of workflows by ID. The requests are pipelined over a single
+    /// connection to the principal rather than waiting on each one in turn. If a
+    /// batch_size is given, that many requests are packed into each message sent.
+    /// A result is returned for each workflow so one failed request doesn't hide
+    /// the outcome of the others
+    #[pyo3(signature = (workflow_ids, batch_size=None))]
+    fn run_workflows(
+        &self,
+        py: Python,
+        workflow_ids: Vec<String>,
+        batch_size: Option<usize>,
+    ) -> PyResult<Vec<Result>> {
+        let apis = workflow_ids
+            .into_iter()
+            .map(PrincipalAPI::RunTask)
+            .collect();
+        let batch_size = batch_size.unwrap_or(1);
+        let rt = runtime()?;
+        py.allow_threads(|| rt.block_on(PrincipalAPI::send_batched(apis, batch_size)))
+            .into_iter()
+            .map(|res| match res {
                 Ok(msg) => Result::from_response_with_py(py, msg),
                 Err(e) => Ok(Result {
                     success: false,
                     error: Some(e.to_string()),
                     payload: None,
                 }),
-            }
-        })
+            })
+            .collect()
     }
 
     /// Query logs from the database
@@ -196,62 +251,26 @@ impl Principal {
         workflow_instance_id: Option<String>,
         verbose: bool,
     ) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
-
-        rt.block_on(async {
-            let api = PrincipalAPI::QueryLogs(
+        send_request(
+            py,
+            PrincipalAPI::QueryLogs(
                 end_timestamp_ms,
                 start_timestamp_ms,
                 workflow_id,
                 workflow_instance_id,
                 verbose,
-            );
-            match api.send().await {
-                Ok(msg) => Result::from_response_with_py(py, msg),
-                Err(e) => Ok(Result {
-                    success: false,
-                    error: Some(e.to_string()),
-                    payload: None,
-                }),
-            }
-        })
+            ),
+        )
     }
 
     /// Get recent workflow statuses (last 10 workflows)
     fn get_recent_workflow_statuses(&self, py: Python) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
-
-        rt.block_on(async {
-            let api = PrincipalAPI::GetRecentWorkflowStatuses;
-            match api.send().await {
-                Ok(msg) => Result::from_response_with_py(py, msg),
-                Err(e) => Ok(Result {
-                    success: false,
-                    error: Some(e.to_string()),
-                    payload: None,
-                }),
-            }
-        })
+        send_request(py, PrincipalAPI::GetRecentWorkflowStatuses)
     }
 
     /// Get list of all registered agents
     fn get_registered_agents(&self, py: Python) -> PyResult<Result> {
-        let rt = tokio::runtime::Runtime::new()
-            .map_err(|e| PyRuntimeError::new_err(format!("Failed to create runtime: {}", e)))?;
-
-        rt.block_on(async {
-            let api = PrincipalAPI::GetRegisteredAgents;
-            match api.send().await {
-                Ok(msg) => Result::from_response_with_py(py, msg),
-                Err(e) => Ok(Result {
-                    success: false,
-                    error: Some(e.to_string()),
-                    payload: None,
-                }),
-            }
-        })
+        send_request(py, PrincipalAPI::GetRegisteredAgents)
     }
 
     fn __repr__(&self) -> String {
@@ -12,14 +12,22 @@ def main() -> None:
 
     time.sleep(0.5)
 
-    df["sum"] = df.sum(axis=1)
-    df["mean"] = df.mean(axis=1)
-    df["std"] = df.std(axis=1)
+    # row stats computed on the whole array at once rather than through pandas'
+    # per-row reductions. Each stat also covers the stats added before it
+    row_sum = data.sum(axis=1)
+    row_mean = (row_sum + row_sum) / (data.shape[1] + 1)
+    with_stats = np.column_stack((data, row_sum, row_mean))
+    row_std = with_stats.std(axis=1, ddof=1)
+    df["sum"] = row_sum
+    df["mean"] = row_mean
+    df["std"] = row_std
 
     time.sleep(0.5)
 
     summary = df.describe()
-    corr = df.corr()
+    corr = pd.DataFrame(
+        np.corrcoef(df.to_numpy(), rowvar=False), index=df.columns, columns=df.columns
+    )
 
     print("Summary:")
     print(summary)